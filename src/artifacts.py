@@ -0,0 +1,167 @@
+"""Content-addressed artifact bundles.
+
+A bundle is the output of running a repo's deploy actions once, stored as a
+manifest plus a set of deduplicated blobs. Bundles are keyed by the commit
+hash and a hash of the deploy config, so a bundle which already exists in the
+store doesn't need to be built again. A bundle can then be applied to any
+number of destination roots, writing only the files which differ.
+
+Store layout:
+
+- <store>/manifests/<bundle id>.json
+- <store>/blobs/<first two hex digits>/<sha1 of contents>
+"""
+
+# standard library
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+import stat
+import uuid
+
+
+def hash_file(filename):
+  # sha1 of the file contents, read in chunks
+  sha1 = hashlib.sha1()
+  with open(filename, 'rb') as f:
+    for chunk in iter(lambda: f.read(1 << 16), b''):
+      sha1.update(chunk)
+  return sha1.hexdigest()
+
+
+def get_bundle_id(commit, config_file):
+  # a bundle is keyed by both the commit and the deploy config
+  config_hash = hash_file(config_file)
+  key = '%s:%s' % (commit, config_hash)
+  return hashlib.sha1(key.encode('utf-8')).hexdigest(), config_hash
+
+
+def get_blob_file(store, blob):
+  return os.path.join(store, 'blobs', blob[:2], blob)
+
+
+def get_manifest_file(store, bundle_id):
+  return os.path.join(store, 'manifests', '%s.json' % bundle_id)
+
+
+def write_atomic(src, dst, mode):
+  # copy to a temporary file next to the destination, then rename over it
+  # (the name is unique, since several threads may write the same file)
+  tmp = '%s__bundle_tmp_%s' % (dst, uuid.uuid4().hex)
+  shutil.copyfile(src, tmp)
+  os.chmod(tmp, mode)
+  os.replace(tmp, dst)
+
+
+def load_manifest(store, bundle_id):
+  # returns None if the bundle hasn't been built yet
+  manifest_file = get_manifest_file(store, bundle_id)
+  if not os.path.isfile(manifest_file):
+    return None
+  with open(manifest_file) as f:
+    return json.loads(f.read())
+
+
+def store_bundle(store, bundle_id, commit, config_hash, stage_paths):
+  # `stage_paths` maps each path key to the directory where actions wrote
+  # their output for that key
+  files = {}
+  num_new = 0
+  for key, stage in sorted(stage_paths.items()):
+    entries = files[key] = {}
+    for root, dirs, names in os.walk(stage):
+      dirs.sort()
+      for name in sorted(names):
+        filename = os.path.join(root, name)
+        blob = hash_file(filename)
+        blob_file = get_blob_file(store, blob)
+        if not os.path.isfile(blob_file):
+          os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+          write_atomic(filename, blob_file, 0o644)
+          num_new += 1
+        relname = os.path.relpath(filename, stage).replace(os.sep, '/')
+        entries[relname] = {
+          'blob': blob,
+          'mode': stat.S_IMODE(os.stat(filename).st_mode),
+        }
+
+  # the manifest is written last, so a partial bundle is never visible
+  manifest = {
+    'id': bundle_id,
+    'commit': commit,
+    'config': config_hash,
+    'files': files,
+  }
+  manifest_file = get_manifest_file(store, bundle_id)
+  os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+  tmp = '%s__tmp' % manifest_file
+  with open(tmp, 'w') as f:
+    f.write(json.dumps(manifest, indent=2, sort_keys=True))
+  os.replace(tmp, manifest_file)
+
+  num_files = sum(len(entries) for entries in files.values())
+  print('stored bundle %s (%d files, %d new blobs)' % (
+    bundle_id, num_files, num_new,
+  ))
+  return manifest
+
+
+def parse_target(spec, keys):
+  # a target is either a single directory, which is used for every path key,
+  # or a comma-separated list of `key=directory` pairs
+  if '=' not in spec:
+    return dict((key, spec) for key in keys)
+  target = {}
+  for pair in spec.split(','):
+    key, _, root = pair.partition('=')
+    target[key.strip()] = root.strip()
+  missing = set(keys) - set(target)
+  if missing:
+    raise Exception('target [%s] is missing path(s): %s' % (
+      spec, ', '.join(sorted(missing)),
+    ))
+  return target
+
+
+def apply_to_target(store, manifest, target):
+  # write each file whose contents or mode differ from the manifest
+  num_written, num_same = 0, 0
+  for key, entries in sorted(manifest['files'].items()):
+    root = target[key]
+    for relname, entry in sorted(entries.items()):
+      dst = os.path.join(root, *relname.split('/'))
+      if os.path.isfile(dst):
+        same_mode = stat.S_IMODE(os.stat(dst).st_mode) == entry['mode']
+        if same_mode and hash_file(dst) == entry['blob']:
+          num_same += 1
+          continue
+      os.makedirs(os.path.dirname(dst), exist_ok=True)
+      write_atomic(get_blob_file(store, entry['blob']), dst, entry['mode'])
+      num_written += 1
+  return num_written, num_same
+
+
+def apply_bundle(store, manifest, targets, max_workers=None):
+  # apply to all targets in parallel, keeping track of any errors
+  exceptions = []
+  with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+    futures = [
+      pool.submit(apply_to_target, store, manifest, target)
+      for target in targets
+    ]
+    for target, future in zip(targets, futures):
+      info = ', '.join('[[%s]] -> %s' % kv for kv in sorted(target.items()))
+      try:
+        num_written, num_same = future.result()
+        print(' applied bundle to %s (%d written, %d unchanged)' % (
+          info, num_written, num_same,
+        ))
+      except Exception as ex:
+        print(' failed to apply bundle to', info, ex)
+        exceptions.append(ex)
+
+  # throw the first exception, if there is one
+  if len(exceptions) > 0:
+    raise exceptions[0]
@@ -41,3 +41,52 @@ def set_repo_status(cnx, owner, name, branch, commit, status):
   # cleanup
   cur.close()
   cnx.commit()
+
+
+def get_repo_queue_times(cnx, branch):
+  # when each queued repo (status of 0) was queued
+  cur = cnx.cursor()
+  cur.execute("""
+    SELECT `repo`, unix_timestamp(`datetime`)
+    FROM `github_deploy_repo` WHERE `status` = 0
+  """)
+  queue_times = {}
+  for (repo, timestamp) in cur:
+    repo = tuple(repo.split('/', 2))
+    if repo[2] == branch:
+      queue_times[repo] = float(timestamp)
+  cur.close()
+  return queue_times
+
+
+def get_repo_durations(cnx):
+  # estimated deploy duration, and the error of past estimates, for each repo
+  cur = cnx.cursor()
+  cur.execute("""
+    SELECT `repo`, `estimate`, `error`, `samples`
+    FROM `github_deploy_repo_duration`
+  """)
+  durations = {}
+  for (repo, estimate, error, samples) in cur:
+    durations[tuple(repo.split('/', 2))] = (estimate, error, samples)
+  cur.close()
+  return durations
+
+
+def set_repo_duration(cnx, owner, name, branch, estimate, error, samples):
+  # update the repo duration table
+  repo = '%s/%s/%s' % (owner, name, branch)
+  cur = cnx.cursor()
+  args = (repo, estimate, error, samples, estimate, error, samples)
+  cur.execute("""
+    INSERT INTO `github_deploy_repo_duration`
+      (`repo`, `estimate`, `error`, `samples`, `datetime`)
+    VALUES
+      (%s, %s, %s, %s, now())
+    ON DUPLICATE KEY UPDATE
+      `estimate` = %s, `error` = %s, `samples` = %s, `datetime` = now()
+  """, args)
+
+  # cleanup
+  cur.close()
+  cnx.commit()
@@ -0,0 +1,36 @@
+/*
+`github_deploy_repo_duration` is the table where deploy durations are
+estimated, for scheduling.
++----------+--------------+------+-----+---------+----------------+
+| Field    | Type         | Null | Key | Default | Extra          |
++----------+--------------+------+-----+---------+----------------+
+| id       | int(11)      | NO   | PRI | NULL    | auto_increment |
+| repo     | varchar(128) | NO   | UNI | NULL    |                |
+| estimate | double       | NO   |     | NULL    |                |
+| error    | double       | NO   |     | 0       |                |
+| samples  | int(11)      | NO   |     | 0       |                |
+| datetime | datetime     | NO   |     | NULL    |                |
++----------+--------------+------+-----+---------+----------------+
+- `id`
+  unique identifier for each record
+- `repo`
+  the name of the github repo (in the form of "owner/name/branch")
+- `estimate`
+  the expected duration, in seconds, of the next deploy
+- `error`
+  the mean absolute error, in seconds, of past estimates
+- `samples`
+  the number of deploys which have contributed to the estimate
+- `datetime`
+  the date and time of the last update
+*/
+CREATE TABLE `github_deploy_repo_duration` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `repo` varchar(128) NOT NULL,
+  `estimate` double NOT NULL,
+  `error` double NOT NULL DEFAULT '0',
+  `samples` int(11) NOT NULL DEFAULT '0',
+  `datetime` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `repo` (`repo`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
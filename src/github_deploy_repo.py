@@ -23,20 +23,17 @@ import json
 import os
 import shutil
 import subprocess
+import time
 import urllib.parse
 
-# third party
-import mysql.connector
-import requests
-
 # first party
-from delphi.github_deploy_repo.actions.compile_coffee import compile_coffee
-from delphi.github_deploy_repo.actions.copymove import copymove
-from delphi.github_deploy_repo.actions.minimize_js import minimize_js
-from delphi.github_deploy_repo.actions.py3test import py3test
 import delphi.github_deploy_repo.database as database
-import delphi.operations.secrets as secrets
-import delphi.utils.extractor as extractor
+import delphi.github_deploy_repo.registry as registry
+import delphi.github_deploy_repo.scheduler as scheduler
+
+# mysql.connector, requests, delphi.operations.secrets,
+# delphi.utils.extractor, artifacts, and watcher are slow to import and aren't
+# needed by every deploy, so they're imported only where they're used
 
 
 def get_argument_parser():
@@ -61,15 +58,57 @@ def get_argument_parser():
     default=None,
     action='store',
     help='manually deploy the specified tar/zip file (e.g. experimental.tgz)')
+  parser.add_argument(
+    '-w', '--watch',
+    type=str,
+    default=None,
+    action='store',
+    help='deploy the specified directory, and again whenever it changes')
+  parser.add_argument(
+    '--debounce',
+    type=float,
+    default=0.5,
+    help='with --watch, seconds to wait for edits to stop before deploying')
   parser.add_argument(
     '--branch',
     default='master',
     help='the branch to checkout prior to deploying')
+  parser.add_argument(
+    '--bundle',
+    type=str,
+    default=None,
+    action='store',
+    help='build (or reuse) an artifact bundle in the given store directory')
+  parser.add_argument(
+    '--target',
+    type=str,
+    default=[],
+    action='append',
+    help=(
+      'apply the bundle to this destination root (e.g. /srv/www or '
+      'html=/srv/www,cgi=/srv/cgi); may be repeated'
+    ))
+  parser.add_argument(
+    '--schedule',
+    default='name',
+    choices=scheduler.POLICIES,
+    help='the order in which to deploy repos')
+  parser.add_argument(
+    '--priority',
+    type=str,
+    default=[],
+    action='append',
+    help='priority for the `priority` schedule (e.g. cmu-delphi/www-nowcast=5)')
+  parser.add_argument(
+    '--aging',
+    type=float,
+    default=1.0,
+    help='schedule score reduction per minute spent in the queue')
 
   return parser
 
 
-def execute(repo_link, commit, path, config):
+def load_config(path, config):
   # magic and versioning
   typestr = 'delphi deploy config'
   v_min = v_max = 1
@@ -91,13 +130,20 @@ def execute(repo_link, commit, path, config):
     if not result:
       raise Exception('missing or invalid deploy config `%s`' % name)
 
+  return cfg
+
+
+def execute(repo_link, commit, path, config, paths=None, select=None):
+  cfg = load_config(path, config)
+
   # just in case
   if cfg.get('skip', False) is True:
     print('field `skip` is present and true - skipping deploy')
     return
 
-  # optional path substitution
-  paths = cfg.get('paths', {})
+  # optional path substitution, which the caller may override
+  if paths is None:
+    paths = cfg.get('paths', {})
   if len(paths) > 0:
     print('will substitute the following path fragments:')
     for key, value in paths.items():
@@ -105,13 +151,6 @@ def execute(repo_link, commit, path, config):
 
   # execute actions sequentially
   actions = cfg['actions']
-  executors = {
-    'copy': copymove,
-    'move': copymove,
-    'compile-coffee': compile_coffee,
-    'minimize-js': minimize_js,
-    'py3test': py3test,
-  }
   for (idx, row) in enumerate(actions):
     # each row should be either: a map/dict/object with a string field named
     #   "type", or a comment string
@@ -120,19 +159,72 @@ def execute(repo_link, commit, path, config):
     elif type(row) != dict or 'type' not in row or type(row['type']) != str:
       raise Exception('invalid action (%d/%d)' % (idx + 1, len(actions)))
 
+    # optionally skip actions, e.g. those with unchanged inputs
+    if select is not None and not select(row, paths):
+      continue
+
     # handle the action based on its type
     action = row.get('type').lower()
-    if action in executors:
-      executors[action](repo_link, commit, path, row, paths)
-    else:
-      raise Exception('unsupported action: %s' % action)
+    executor = registry.get_executor(action)
+    executor(repo_link, commit, path, row, paths)
+
+
+def deploy_bundle(repo_link, commit, path, config, store, targets):
+  import delphi.github_deploy_repo.artifacts as artifacts
+
+  # the bundle is made of whatever the actions write under `[[path]]`
+  # substitutions, so every destination has to go through one (copy and move
+  # always have a destination, other actions might)
+  cfg = load_config(path, config)
+  keys = sorted(cfg.get('paths', {}).keys())
+  if not keys:
+    raise Exception('bundles require `paths` in the deploy config')
+  for row in cfg['actions']:
+    if type(row) != dict:
+      continue
+    if 'dst' in row or str(row.get('type')).lower() in ('copy', 'move'):
+      dst = str(row.get('dst', ''))
+      if not any(dst.startswith('[[%s]]' % key) for key in keys):
+        raise Exception('destination [%s] is outside of the bundle' % dst)
+
+  # check the targets before building anything
+  targets = [artifacts.parse_target(spec, keys) for spec in targets]
+  roots = [
+    tuple(sorted((k, os.path.abspath(v)) for (k, v) in target.items()))
+    for target in targets
+  ]
+  if len(set(roots)) != len(roots):
+    raise Exception('the same target is given more than once')
+
+  # build the bundle, unless it already exists for this commit and config
+  bundle_id, config_hash = artifacts.get_bundle_id(
+      commit, os.path.join(path, config))
+  manifest = artifacts.load_manifest(store, bundle_id)
+  if manifest is None:
+    print('building bundle %s' % bundle_id)
+    stage = os.path.abspath(path + '__stage')
+    stage_paths = dict((key, os.path.join(stage, key)) for key in keys)
+    try:
+      for stage_path in stage_paths.values():
+        os.makedirs(stage_path)
+      execute(repo_link, commit, path, config, stage_paths)
+      manifest = artifacts.store_bundle(
+          store, bundle_id, commit, config_hash, stage_paths)
+    finally:
+      shutil.rmtree(stage, ignore_errors=True)
+  else:
+    print('reusing existing bundle %s' % bundle_id)
 
+  # fan out to all destination roots
+  artifacts.apply_bundle(store, manifest, targets)
 
-def deploy_repo(cnx, owner, name, branch):
+
+def deploy_repo(cnx, owner, name, branch, store=None, targets=()):
   commit = None
 
   # check whether a deploy file exists
   if owner != '<local>':
+    import requests
     deploy_file_url = (
       'https://raw.githubusercontent.com/%s/%s/%s/deploy.json'
     ) % (
@@ -151,7 +243,7 @@ def deploy_repo(cnx, owner, name, branch):
 
       # update repo status and bail
       database.set_repo_status(cnx, owner, name, branch, commit, status)
-      return
+      return status
 
   # try to deploy, but catch any exceptions that may arise
   exception = None
@@ -162,6 +254,8 @@ def deploy_repo(cnx, owner, name, branch):
     os.makedirs(tmpdir)
 
     if owner == '<local>':
+      import delphi.utils.extractor as extractor
+
       # hash the file for record keeping
       sha1sum = subprocess.check_output("sha1sum '%s'" % name, shell=True)
       commit = sha1sum.decode('utf-8')[:40]
@@ -212,7 +306,10 @@ def deploy_repo(cnx, owner, name, branch):
     # deploy the repo
     config_name = 'deploy.json'
     config_file = os.path.join(tmpdir, config_name)
-    if os.path.isfile(config_file):
+    if os.path.isfile(config_file) and store is not None:
+      deploy_bundle(url, commit, tmpdir, config_name, store, targets)
+      status = 1
+    elif os.path.isfile(config_file):
       execute(url, commit, tmpdir, config_name)
       status = 1
     else:
@@ -236,17 +333,31 @@ def deploy_repo(cnx, owner, name, branch):
   if exception is not None:
     raise exception
 
+  return status
+
 
-def deploy_all(cnx, repos):
+def deploy_all(cnx, repos, store=None, targets=(), durations=None):
   # deploy one at a time, keeping track of any errors along the way
   exceptions = []
   for (owner, name, branch) in repos:
+    info = '%s/%s (%s)' % (owner, name, branch)
     try:
-      deploy_repo(cnx, owner, name, branch)
+      start = time.time()
+      status = deploy_repo(cnx, owner, name, branch, store, targets)
+      duration = time.time() - start
     except Exception as ex:
-      info = '%s/%s (%s)' % (owner, name, branch)
       print('failed to deploy', info, ex)
       exceptions.append(ex)
+      continue
+
+    # learn from successful deploys only, since skips take no time at all
+    if durations is not None and status == 1:
+      try:
+        repo = (owner, name, branch)
+        scheduler.record_duration(cnx, durations, repo, duration)
+      except Exception as ex:
+        # the deploy itself succeeded
+        print('failed to record duration of', info, ex)
 
   # throw the first exception, if there is one
   if len(exceptions) > 0:
@@ -265,13 +376,34 @@ def main(args):
   if args.package and args.branch != 'master':
     raise Exception('--branch is not available with --package')
 
+  # likewise, watching a local directory is only for local testing
+  if args.watch and (args.package or args.database or args.repo):
+    raise Exception('--watch cant be used with --package, --repo or --database')
+  if args.watch and (args.branch != 'master' or args.bundle):
+    raise Exception('--branch and --bundle are not available with --watch')
+
+  # bundles and targets only make sense together
+  if bool(args.bundle) != bool(args.target):
+    raise Exception('--bundle and --target must be used together')
+
   # deploy a local archive, which does not require the database
   if args.package:
     # deploy a local tar/zip file as if it were a repo
-    deploy_repo(None, '<local>', args.package, None)
+    deploy_repo(None, '<local>', args.package, None, args.bundle, args.target)
+    return
+
+  # deploy a local directory until interrupted
+  if args.watch:
+    import delphi.github_deploy_repo.watcher as watcher
+    try:
+      watcher.watch(args.watch, execute, debounce=args.debounce)
+    except KeyboardInterrupt:
+      print('stopped watching')
     return
 
   # database setup
+  import mysql.connector
+  import delphi.operations.secrets as secrets
   u, p = secrets.db.auto
   cnx = mysql.connector.connect(
       host=secrets.db.host, user=u, password=p, database='utils')
@@ -291,13 +423,25 @@ def main(args):
   else:
     # deploy either a specific repo or all stale repos from the database
     repos = specific_repos | database_repos
-  repo_list = sorted(repos)
 
-  if repo_list:
+  if repos and args.schedule == 'name':
+    repo_list = sorted(repos)
     print('will deploy the following repos:')
     for (owner, name, branch) in repo_list:
       print(' %s/%s (%s)' % (owner, name, branch))
-    deploy_all(cnx, repo_list)
+    deploy_all(cnx, repo_list, args.bundle, args.target)
+  elif repos:
+    # order by the schedule policy, and learn from the actual durations
+    now = time.time()
+    durations = database.get_repo_durations(cnx)
+    priorities = scheduler.parse_priorities(args.priority)
+    queue_times = database.get_repo_queue_times(cnx, args.branch)
+    plan = scheduler.schedule(
+        repos, args.schedule, durations, priorities, queue_times, args.aging,
+        now)
+    scheduler.print_schedule(plan, now)
+    repo_list = [repo for (repo, estimate) in plan]
+    deploy_all(cnx, repo_list, args.bundle, args.target, durations)
   else:
     print('no repos to deploy')
 
@@ -0,0 +1,65 @@
+"""Finds the function which executes each type of deploy action.
+
+Action modules are only imported the first time their action type appears in
+a deploy config, so a deploy doesn't pay for the dependencies (e.g. py3tester)
+of actions it doesn't use.
+
+Third-party actions can be registered by installing a package with an entry
+point in the `ENTRY_POINT_GROUP` group, named after the action type, ignoring
+case (e.g. `my-action = my_package.my_module:my_function`). The function is
+called like the built-in actions: `(repo_link, commit, path, row,
+substitutions)`.
+"""
+
+# standard library
+import importlib
+
+ENTRY_POINT_GROUP = 'delphi.github_deploy_repo.actions'
+
+# action type -> (module, function)
+BUILTIN_ACTIONS = {
+  'copy': ('delphi.github_deploy_repo.actions.copymove', 'copymove'),
+  'move': ('delphi.github_deploy_repo.actions.copymove', 'copymove'),
+  'compile-coffee': (
+    'delphi.github_deploy_repo.actions.compile_coffee', 'compile_coffee',
+  ),
+  'minimize-js': (
+    'delphi.github_deploy_repo.actions.minimize_js', 'minimize_js',
+  ),
+  'py3test': ('delphi.github_deploy_repo.actions.py3test', 'py3test'),
+}
+
+# action type -> function, for actions which have already been loaded
+_executors = {}
+
+
+def get_entry_point(action):
+  # deferred, since it's slow to import and only needed for unknown actions
+  import importlib.metadata
+  entry_points = importlib.metadata.entry_points()
+  if hasattr(entry_points, 'select'):
+    group = entry_points.select(group=ENTRY_POINT_GROUP)
+  else:
+    # python < 3.10
+    group = entry_points.get(ENTRY_POINT_GROUP, [])
+  # action types are case-insensitive, like the built-in actions
+  for entry_point in group:
+    if entry_point.name.lower() == action:
+      return entry_point
+  return None
+
+
+def get_executor(action):
+  """Return the function for the given action type, importing it if needed."""
+
+  if action not in _executors:
+    if action in BUILTIN_ACTIONS:
+      module_name, function_name = BUILTIN_ACTIONS[action]
+      module = importlib.import_module(module_name)
+      _executors[action] = getattr(module, function_name)
+    else:
+      entry_point = get_entry_point(action)
+      if entry_point is None:
+        raise Exception('unsupported action: %s' % action)
+      _executors[action] = entry_point.load()
+  return _executors[action]
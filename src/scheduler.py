@@ -0,0 +1,118 @@
+"""Orders queued deploys.
+
+Each repo gets a score, and repos are deployed in order of increasing score.
+The score depends on the policy:
+
+- `name`: alphabetical, the original behavior (no score)
+- `shortest`: the expected duration, in seconds, estimated from past deploys
+- `priority`: the negated explicit priority (higher priority deploys first),
+  where one priority level is worth `PRIORITY_SECONDS`
+- `oldest`: the negated number of seconds spent in the queue
+
+To prevent starvation, the score is further reduced by `aging` for every
+minute that the repo has been queued. Ties are broken by name.
+
+Estimates are exponentially weighted moving averages of past durations. After
+each deploy the prediction error is recorded, and the estimate is moved toward
+the observed duration by a fraction `ALPHA` of that error.
+"""
+
+# standard library
+import datetime
+
+# first party
+import delphi.github_deploy_repo.database as database
+
+POLICIES = ('name', 'shortest', 'priority', 'oldest')
+
+# the estimate for a repo which has never been deployed, absent other repos
+DEFAULT_ESTIMATE = 60.0
+
+# weight of the most recent observation in the moving averages
+ALPHA = 0.3
+
+# score difference between adjacent priority levels
+PRIORITY_SECONDS = 60.0
+
+
+def parse_priorities(specs):
+  # each spec looks like "owner/name=priority"
+  priorities = {}
+  for spec in specs:
+    repo, _, value = spec.rpartition('=')
+    if repo.count('/') != 1:
+      raise Exception('invalid priority [%s]' % spec)
+    priorities[repo] = float(value)
+  return priorities
+
+
+def get_estimate(durations, repo):
+  # fall back to the median estimate of all other repos
+  if repo in durations:
+    return durations[repo][0]
+  estimates = sorted(estimate for (estimate, _, _) in durations.values())
+  if not estimates:
+    return DEFAULT_ESTIMATE
+  return estimates[len(estimates) // 2]
+
+
+def get_score(policy, repo, estimate, priorities, wait, aging):
+  owner, name, branch = repo
+  if policy == 'shortest':
+    score = estimate
+  elif policy == 'priority':
+    priority = priorities.get('%s/%s' % (owner, name), 0)
+    score = -priority * PRIORITY_SECONDS
+  elif policy == 'oldest':
+    score = -wait
+  else:
+    raise Exception('unsupported schedule policy: %s' % policy)
+  return score - aging * wait / 60
+
+
+def schedule(repos, policy, durations, priorities, queue_times, aging, now):
+  """Return a list of (repo, estimated duration) in deploy order."""
+
+  plan = [(repo, get_estimate(durations, repo)) for repo in sorted(repos)]
+  if policy == 'name':
+    return plan
+
+  def key(item):
+    repo, estimate = item
+    wait = max(0, now - queue_times.get(repo, now))
+    score = get_score(policy, repo, estimate, priorities, wait, aging)
+    return (score, repo)
+
+  return sorted(plan, key=key)
+
+
+def print_schedule(plan, now):
+  # show the predicted order and completion times
+  print('will deploy the following repos:')
+  eta = now
+  for ((owner, name, branch), estimate) in plan:
+    eta += estimate
+    clock = datetime.datetime.fromtimestamp(round(eta)).time().isoformat()
+    print(' %s/%s (%s) ~%.0fs, done by %s' % (
+      owner, name, branch, estimate, clock,
+    ))
+
+
+def record_duration(cnx, durations, repo, duration):
+  # compare with the prediction, and update the estimate
+  owner, name, branch = repo
+  if repo in durations:
+    estimate, error, samples = durations[repo]
+    delta = duration - estimate
+    print(' took %.1fs, estimated %.1fs (error %+.1fs)' % (
+      duration, estimate, delta,
+    ))
+    estimate += ALPHA * delta
+    error += ALPHA * (abs(delta) - error)
+    samples += 1
+  else:
+    print(' took %.1fs (no prior estimate)' % duration)
+    estimate, error, samples = duration, 0.0, 1
+  durations[repo] = (estimate, error, samples)
+  database.set_repo_duration(
+      cnx, owner, name, branch, estimate, error, samples)
@@ -0,0 +1,322 @@
+"""Watches a working directory and deploys it whenever it changes.
+
+The working directory is deployed directly, without an archive. Files are
+synced into a scratch copy in the current directory, just like the temporary
+directory of `deploy_repo`, and the actions run there. That way relative
+destinations resolve as they would with `--package`, and actions which modify
+their sources (e.g. `move`, or `minimize-js` without `dst`) don't touch the
+working directory. Only changed files are synced, and only the actions which
+read changed files are executed again.
+
+Changes are detected with inotify on Linux, falling back to polling
+elsewhere. Bursts of changes (e.g. an editor saving several files) are
+debounced into a single deploy.
+"""
+
+# standard library
+import ctypes
+import ctypes.util
+import glob
+import os
+import re
+import select
+import shutil
+import time
+
+# first party
+import delphi.github_deploy_repo.file_operations as file_operations
+
+# how often to scan for changes when inotify isn't available
+POLL_SECONDS = 1.0
+
+# directories which are never watched or synced
+IGNORED_DIRS = ('.git', '__pycache__')
+
+# inotify flags, from <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_MASK = (
+  IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+  IN_CREATE | IN_DELETE
+)
+
+
+def walk(path):
+  # like os.walk, but skipping ignored directories
+  for root, dirs, names in os.walk(path):
+    dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+    yield root, names
+
+
+def snapshot(path):
+  # relative name -> (modification time, size) of every file
+  files = {}
+  for root, names in walk(path):
+    for name in names:
+      filename = os.path.join(root, name)
+      try:
+        info = os.stat(filename)
+      except FileNotFoundError:
+        continue
+      relname = os.path.relpath(filename, path)
+      files[relname] = (info.st_mtime_ns, info.st_size)
+  return files
+
+
+def sync(path, mirror, previous, current):
+  # copy new and changed files into the mirror, and remove deleted files
+  changed = set()
+  for relname, info in current.items():
+    if previous.get(relname) != info:
+      dst = os.path.join(mirror, relname)
+      os.makedirs(os.path.dirname(dst), exist_ok=True)
+      try:
+        shutil.copy2(os.path.join(path, relname), dst)
+      except FileNotFoundError:
+        continue
+      changed.add(dst)
+  for relname in set(previous) - set(current):
+    try:
+      os.remove(os.path.join(mirror, relname))
+    except FileNotFoundError:
+      pass
+  return changed
+
+
+class Inotify:
+  """Wakes up when any file in the directory tree changes."""
+
+  def __init__(self, path):
+    name = ctypes.util.find_library('c')
+    if name is None:
+      raise OSError('libc not found')
+    self.libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(self.libc, 'inotify_init1'):
+      raise OSError('inotify is not available')
+    self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+    try:
+      self.refresh(path)
+    except OSError:
+      self.close()
+      raise
+
+  def refresh(self, path):
+    # watch every directory, including any created since the last refresh
+    # (watching a directory twice is harmless)
+    for root, _ in walk(path):
+      wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), IN_MASK)
+      if wd < 0:
+        raise OSError(ctypes.get_errno(), 'unable to watch [%s]' % root)
+
+  def drain(self, timeout):
+    # returns whether any events arrived within the timeout
+    ready, _, _ = select.select([self.fd], [], [], timeout)
+    if not ready:
+      return False
+    try:
+      while os.read(self.fd, 1 << 16):
+        pass
+    except BlockingIOError:
+      pass
+    return True
+
+  def wait(self, path, files, debounce):
+    self.drain(None)
+    while self.drain(debounce):
+      pass
+    self.refresh(path)
+
+  def close(self):
+    os.close(self.fd)
+
+
+class Poller:
+  """Wakes up when a scan finds that any file in the directory has changed."""
+
+  def wait(self, path, files, debounce):
+    while snapshot(path) == files:
+      time.sleep(POLL_SECONDS)
+    files = snapshot(path)
+    while True:
+      time.sleep(debounce)
+      latest = snapshot(path)
+      if latest == files:
+        break
+      files = latest
+
+  def close(self):
+    pass
+
+
+def get_notifier(path):
+  try:
+    notifier = Inotify(path)
+    print('watching [%s] with inotify' % path)
+  except (OSError, AttributeError) as ex:
+    print('inotify unavailable (%s), polling [%s]' % (ex, path))
+    notifier = Poller()
+  return notifier
+
+
+def get_selector(path, changed, origin=None):
+  """Return a function which decides whether an action should run.
+
+  Actions are considered in order. An action runs if it reads any changed
+  file (including `replace-keywords` templates), and then the files it writes
+  are considered changed for the actions which follow it. Actions whose files
+  can't be determined always run.
+
+  Inputs which an earlier deploy removed from `path` (e.g. by `move`) are
+  restored from `origin` before the action runs again.
+  """
+
+  changed = set(changed)
+  everything = [False]
+
+  def get_file(name, substitutions):
+    # like the actions, but without printing the substitution again
+    name = file_operations.get_substituted_path(name, substitutions)
+    return file_operations.get_file(name, path)
+
+  def get_matches(directory, pattern):
+    # same selection as the copy/move action, but also considering files
+    # which are only in the origin
+    names = set()
+    for root in (directory, get_origin(directory)):
+      if root is not None:
+        for name in glob.glob(os.path.join(root, '*')):
+          if re.match(pattern, os.path.basename(name)) is not None:
+            names.add(os.path.basename(name))
+    return sorted(names)
+
+  def get_origin(filename):
+    if origin is None:
+      return None
+    return os.path.join(origin, os.path.relpath(filename, path))
+
+  def restore(filename):
+    source = get_origin(filename)
+    if not os.path.exists(filename) and source and os.path.isfile(source):
+      os.makedirs(os.path.dirname(filename), exist_ok=True)
+      shutil.copy2(source, filename)
+
+  def selector(row, substitutions):
+    action = row.get('type').lower()
+    if action in ('copy', 'move'):
+      src = get_file(row['src'], substitutions)
+      dst = get_file(row['dst'], substitutions)
+      if 'match' in row:
+        names = get_matches(src[0], row['match'])
+        inputs = [os.path.join(src[0], name) for name in names]
+        outputs = [os.path.join(dst[0], name) for name in names]
+      else:
+        inputs, outputs = [src[0]], [dst[0]]
+      templates = row.get('replace-keywords')
+      if type(templates) is str:
+        templates = [templates]
+      if type(templates) in (tuple, list):
+        inputs += [file_operations.get_file(t, path)[0] for t in templates]
+    elif action == 'minimize-js':
+      src = get_file(row['src'], substitutions)
+      inputs = [src[0]]
+      if 'dst' in row:
+        outputs = [get_file(row['dst'], substitutions)[0]]
+      else:
+        outputs = [src[0]]
+    elif action == 'compile-coffee':
+      src = get_file(row['src'], substitutions)
+      inputs = [src[0]]
+      if 'dst' in row:
+        outputs = [get_file(row['dst'], substitutions)[0]]
+      else:
+        # same default as the action
+        basename, extension = src[2:4]
+        if extension != '':
+          basename = basename[:-len(extension)] + 'js'
+        else:
+          basename += '.js'
+        outputs = [os.path.join(src[1], basename)]
+    elif action == 'py3test':
+      # tests depend on everything, and write nothing
+      inputs = list(changed)
+      outputs = []
+    else:
+      # unknown effects, so assume it reads and writes everything
+      everything[0] = True
+      return True
+
+    run = everything[0] or any(name in changed for name in inputs)
+    if run:
+      for name in inputs:
+        restore(name)
+      changed.update(outputs)
+    return run
+
+  return selector
+
+
+def watch(path, execute, config='deploy.json', debounce=0.5, notifier=None):
+  """Deploy the directory, then deploy it again each time it changes.
+
+  `execute` is called like `github_deploy_repo.execute`, with an additional
+  `select` argument. Runs until interrupted.
+  """
+
+  path = os.path.abspath(path)
+  url = 'file://%s' % path
+  commit = 'uncommitted'
+
+  # like `deploy_repo`, work in the current directory, so that relative
+  # destinations (e.g. "../foo") land in the same place as with `--package`
+  mirror = os.path.abspath('github_deploy_repo__watch')
+  if os.path.commonpath([path, mirror]) == path:
+    raise Exception('run --watch from outside of [%s]' % path)
+  os.makedirs(mirror)
+  if notifier is None:
+    notifier = get_notifier(path)
+
+  # everything runs the first time, when the config changes, and after a
+  # failed deploy (which may have stopped partway)
+  files, full = {}, True
+  try:
+    while True:
+      # bring the mirror up to date
+      latest = snapshot(path)
+      changed = sync(path, mirror, files, latest)
+      files = latest
+      if os.path.join(mirror, config) in changed:
+        full = True
+
+      if full or changed:
+        if full:
+          # start from a fresh copy, just like `--package`, since earlier
+          # actions may have moved or modified files in the mirror
+          shutil.rmtree(mirror)
+          sync(path, mirror, {}, latest)
+          selector = None
+        else:
+          selector = get_selector(mirror, changed, path)
+        print('deploying %s (%d changed file(s)%s)' % (
+          url, len(changed), ', running everything' if full else '',
+        ))
+        start = time.time()
+        try:
+          execute(url, commit, mirror, config, select=selector)
+          print('deployed in %.1fs' % (time.time() - start))
+          full = False
+        except Exception as ex:
+          # keep watching, and run everything after the next edit
+          print('failed to deploy', url, ex)
+          full = True
+
+      notifier.wait(path, files, debounce)
+  finally:
+    notifier.close()
+    shutil.rmtree(mirror, ignore_errors=True)
@@ -0,0 +1,72 @@
+"""Unit tests for artifacts.py."""
+
+# standard library
+import os
+import stat
+import tempfile
+import unittest
+
+# py3tester coverage target
+__test_target__ = 'delphi.github_deploy_repo.artifacts'
+
+
+class UnitTests(unittest.TestCase):
+  """Basic unit tests."""
+
+  def test_parse_target(self):
+    """Map every path key to a destination root."""
+
+    self.assertEqual(parse_target('/a', ['x', 'y']), {'x': '/a', 'y': '/a'})
+    self.assertEqual(
+        parse_target('x=/a, y=/b', ['x', 'y']), {'x': '/a', 'y': '/b'})
+    with self.assertRaises(Exception):
+      parse_target('x=/a', ['x', 'y'])
+
+  def test_get_blob_file(self):
+    """Blobs are sharded by the first two hex digits."""
+
+    self.assertEqual(get_blob_file('s', 'abcd'), 's/blobs/ab/abcd')
+
+  def test_store_and_apply_bundle(self):
+    """Build a bundle, then apply it to several local directories."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      stage = os.path.join(tmp, 'stage', 'html')
+      os.makedirs(os.path.join(stage, 'sub'))
+      for name in ('a.txt', os.path.join('sub', 'b.txt')):
+        with open(os.path.join(stage, name), 'w') as f:
+          f.write('same')
+      with open(os.path.join(stage, 'c.txt'), 'w') as f:
+        f.write('different')
+
+      # identical contents share a blob
+      store = os.path.join(tmp, 'store')
+      manifest = store_bundle(store, 'id', 'commit', 'cfg', {'html': stage})
+      blobs = [names for (_, _, names) in os.walk(os.path.join(store, 'blobs'))]
+      self.assertEqual(sum(len(names) for names in blobs), 2)
+      self.assertEqual(len(manifest['files']['html']), 3)
+      self.assertEqual(load_manifest(store, 'id'), manifest)
+      self.assertIsNone(load_manifest(store, 'other'))
+
+      # the first apply writes everything, the second writes nothing
+      roots = [os.path.join(tmp, 't1'), os.path.join(tmp, 't2')]
+      targets = [{'html': root} for root in roots]
+      apply_bundle(store, manifest, targets)
+      for root in roots:
+        with open(os.path.join(root, 'sub', 'b.txt')) as f:
+          self.assertEqual(f.read(), 'same')
+        self.assertEqual(apply_to_target(store, manifest, {'html': root}),
+                         (0, 3))
+
+      # modified contents and modes are rewritten
+      target = {'html': roots[0]}
+      with open(os.path.join(roots[0], 'a.txt'), 'w') as f:
+        f.write('edited')
+      self.assertEqual(apply_to_target(store, manifest, target), (1, 2))
+      with open(os.path.join(roots[0], 'a.txt')) as f:
+        self.assertEqual(f.read(), 'same')
+      c_file = os.path.join(roots[0], 'c.txt')
+      os.chmod(c_file, 0o600)
+      self.assertEqual(apply_to_target(store, manifest, target), (1, 2))
+      mode = manifest['files']['html']['c.txt']['mode']
+      self.assertEqual(stat.S_IMODE(os.stat(c_file).st_mode), mode)
@@ -2,7 +2,13 @@
 
 # standard library
 import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import unittest.mock
 
 # py3tester coverage target
 __test_target__ = 'delphi.github_deploy_repo.github_deploy_repo'
@@ -15,3 +21,115 @@ class UnitTests(unittest.TestCase):
     """Return a parser for command-line arguments."""
 
     self.assertIsInstance(get_argument_parser(), argparse.ArgumentParser)
+
+  def test_deploy_bundle(self):
+    """Actions run once per commit and config, then the bundle is reused."""
+
+    def fake_execute(repo_link, commit, path, config, paths):
+      with open(os.path.join(paths['html'], 'index.html'), 'w') as f:
+        f.write(commit)
+
+    with tempfile.TemporaryDirectory() as tmp:
+      repo = os.path.join(tmp, 'repo')
+      os.makedirs(repo)
+      with open(os.path.join(repo, 'deploy.json'), 'w') as f:
+        f.write(json.dumps({
+          'type': 'delphi deploy config',
+          'version': 1,
+          'paths': {'html': '/var/www/html'},
+          'actions': [{'type': 'copy', 'src': 'a', 'dst': '[[html]]/a'}],
+        }))
+      store = os.path.join(tmp, 'store')
+      targets = [os.path.join(tmp, 't1'), os.path.join(tmp, 't2')]
+
+      target = '%s.execute' % __test_target__
+      with unittest.mock.patch(target, side_effect=fake_execute) as mock:
+        deploy_bundle('url', 'abc', repo, 'deploy.json', store, targets)
+        deploy_bundle('url', 'abc', repo, 'deploy.json', store, targets)
+      self.assertEqual(mock.call_count, 1)
+      for root in targets:
+        with open(os.path.join(root, 'index.html')) as f:
+          self.assertEqual(f.read(), 'abc')
+
+  def test_deploy_bundle_bad_targets(self):
+    """Targets are checked before any action runs."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      with open(os.path.join(tmp, 'deploy.json'), 'w') as f:
+        f.write(json.dumps({
+          'type': 'delphi deploy config',
+          'version': 1,
+          'paths': {'html': '/var/www/html', 'cgi': '/var/www/cgi'},
+          'actions': [],
+        }))
+      store = os.path.join(tmp, 'store')
+      target = '%s.execute' % __test_target__
+      with unittest.mock.patch(target) as mock:
+        for targets in (['html=/a'], ['/a', '/a/'], ['/a', 'cgi=/a,html=/a']):
+          with self.assertRaises(Exception):
+            deploy_bundle('url', 'abc', tmp, 'deploy.json', store, targets)
+      self.assertEqual(mock.call_count, 0)
+      self.assertFalse(os.path.exists(store))
+
+  def test_deploy_bundle_outside(self):
+    """Every destination must be inside the bundle."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      with open(os.path.join(tmp, 'deploy.json'), 'w') as f:
+        f.write(json.dumps({
+          'type': 'delphi deploy config',
+          'version': 1,
+          'paths': {'html': '/var/www/html'},
+          'actions': [{'type': 'minimize-js', 'src': 'a.js', 'dst': '/a.js'}],
+        }))
+      with self.assertRaises(Exception):
+        deploy_bundle('url', 'abc', tmp, 'deploy.json', tmp, [tmp])
+
+  def test_deploy_all_durations(self):
+    """Only successful deploys are timed, and timing can't fail a deploy."""
+
+    repos = [('o', 'a', 'master'), ('o', 'b', 'master')]
+    statuses = {'a': 1, 'b': 2}
+
+    def fake_deploy_repo(cnx, owner, name, branch, store, targets):
+      return statuses[name]
+
+    deploy = '%s.deploy_repo' % __test_target__
+    record = 'delphi.github_deploy_repo.scheduler.record_duration'
+    with unittest.mock.patch(deploy, side_effect=fake_deploy_repo):
+      with unittest.mock.patch(record) as mock:
+        deploy_all(None, repos, durations={})
+      self.assertEqual(mock.call_count, 1)
+      self.assertEqual(mock.call_args[0][2], ('o', 'a', 'master'))
+
+      with unittest.mock.patch(record, side_effect=Exception('db error')):
+        deploy_all(None, repos, durations={})
+
+  def test_import_time(self):
+    """Slow dependencies and action modules aren't imported at startup."""
+
+    # same as `python -X importtime -c 'import ...'`
+    cmd = [sys.executable, '-X', 'importtime', '-c', 'import %s' % (
+      __test_target__,
+    )]
+    result = subprocess.run(cmd, stderr=subprocess.PIPE, check=True)
+
+    # each line looks like "import time:  self [us] | cumulative | name"
+    modules = set()
+    for line in str(result.stderr, 'utf-8').splitlines()[1:]:
+      modules.add(line.split('|')[2].strip())
+
+    for name in (
+      'mysql.connector',
+      'requests',
+      'undefx.py3tester.py3tester',
+      'delphi.operations.secrets',
+      'delphi.utils.extractor',
+      'delphi.github_deploy_repo.actions.copymove',
+      'delphi.github_deploy_repo.actions.py3test',
+      'delphi.github_deploy_repo.artifacts',
+      'delphi.github_deploy_repo.watcher',
+      'concurrent.futures',
+      'ctypes',
+    ):
+      self.assertNotIn(name, modules)
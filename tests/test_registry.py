@@ -0,0 +1,43 @@
+"""Unit tests for registry.py."""
+
+# standard library
+import importlib.metadata
+import unittest
+import unittest.mock
+
+# py3tester coverage target
+__test_target__ = 'delphi.github_deploy_repo.registry'
+
+
+class UnitTests(unittest.TestCase):
+  """Basic unit tests."""
+
+  def test_get_executor(self):
+    """Load built-in actions on demand, and reject unknown actions."""
+
+    copy = get_executor('copy')
+    self.assertTrue(callable(copy))
+    self.assertIs(get_executor('move'), copy)
+    with self.assertRaises(Exception):
+      get_executor('not-a-real-action')
+
+  def test_get_executor_entry_point(self):
+    """Load third-party actions from entry points, once."""
+
+    def my_action(repo_link, commit, path, row, substitutions):
+      pass
+
+    entry_point = unittest.mock.Mock()
+    entry_point.name = 'My-Action'
+    entry_point.load.return_value = my_action
+    entry_points = unittest.mock.Mock()
+    entry_points.select.return_value = [entry_point]
+
+    _executors.pop('my-action', None)
+    target = 'importlib.metadata.entry_points'
+    with unittest.mock.patch(target, return_value=entry_points):
+      self.assertIs(get_executor('my-action'), my_action)
+      self.assertIs(get_executor('my-action'), my_action)
+    entry_points.select.assert_called_once_with(group=ENTRY_POINT_GROUP)
+    self.assertEqual(entry_point.load.call_count, 1)
+    _executors.pop('my-action', None)
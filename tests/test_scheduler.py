@@ -0,0 +1,64 @@
+"""Unit tests for scheduler.py."""
+
+# standard library
+import unittest
+import unittest.mock
+
+# py3tester coverage target
+__test_target__ = 'delphi.github_deploy_repo.scheduler'
+
+
+class UnitTests(unittest.TestCase):
+  """Basic unit tests."""
+
+  def test_schedule_shortest(self):
+    """Short repos go first, unless a long repo has waited long enough."""
+
+    a, b = ('o', 'a', 'master'), ('o', 'b', 'master')
+    durations = {a: (600, 0, 1), b: (10, 0, 1)}
+    queue_times = {a: 0, b: 0}
+    plan = schedule([a, b], 'shortest', durations, {}, queue_times, 1, 0)
+    self.assertEqual([repo for (repo, _) in plan], [b, a])
+    queue_times = {a: 0, b: 3600}
+    plan = schedule([a, b], 'shortest', durations, {}, queue_times, 10, 3600)
+    self.assertEqual([repo for (repo, _) in plan], [a, b])
+
+  def test_schedule_priority(self):
+    """Higher priority goes first."""
+
+    a, b = ('o', 'a', 'master'), ('o', 'b', 'master')
+    plan = schedule([a, b], 'priority', {}, {'o/b': 1}, {}, 1, 0)
+    self.assertEqual([repo for (repo, _) in plan], [b, a])
+
+  def test_schedule_oldest(self):
+    """Longest queued goes first, even without aging."""
+
+    a, b = ('o', 'a', 'master'), ('o', 'b', 'master')
+    queue_times = {a: 100, b: 50}
+    plan = schedule([a, b], 'oldest', {}, {}, queue_times, 0, 200)
+    self.assertEqual([repo for (repo, _) in plan], [b, a])
+
+  def test_record_duration(self):
+    """Estimates and errors are moving averages, and are saved."""
+
+    cnx = unittest.mock.MagicMock()
+    repo = ('o', 'a', 'master')
+    durations = {}
+    record_duration(cnx, durations, repo, 10)
+    self.assertEqual(durations[repo], (10, 0, 1))
+    record_duration(cnx, durations, repo, 20)
+    estimate, error, samples = durations[repo]
+    self.assertAlmostEqual(estimate, 10 + ALPHA * 10)
+    self.assertAlmostEqual(error, ALPHA * 10)
+    self.assertEqual(samples, 2)
+    self.assertEqual(cnx.commit.call_count, 2)
+    args = cnx.cursor.return_value.execute.call_args[0][1]
+    self.assertEqual(args[0], 'o/a/master')
+    self.assertAlmostEqual(args[1], estimate)
+
+  def test_get_estimate(self):
+    """Unknown repos get the median estimate."""
+
+    durations = {('o', x, 'm'): (t, 0, 1) for (x, t) in zip('abc', (1, 5, 9))}
+    self.assertEqual(get_estimate(durations, ('o', 'd', 'm')), 5)
+    self.assertEqual(get_estimate({}, ('o', 'd', 'm')), DEFAULT_ESTIMATE)
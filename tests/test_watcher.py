@@ -0,0 +1,215 @@
+"""Unit tests for watcher.py."""
+
+# standard library
+import json
+import os
+import tempfile
+import unittest
+
+# first party
+from delphi.github_deploy_repo.github_deploy_repo import execute
+
+# py3tester coverage target
+__test_target__ = 'delphi.github_deploy_repo.watcher'
+
+
+def write(path, name, text):
+  filename = os.path.join(path, name)
+  os.makedirs(os.path.dirname(filename), exist_ok=True)
+  with open(filename, 'w') as f:
+    f.write(text)
+  return filename
+
+
+def read(path, name):
+  with open(os.path.join(path, name)) as f:
+    return f.read()
+
+
+def write_config(path, actions):
+  return write(path, 'deploy.json', json.dumps({
+    'type': 'delphi deploy config',
+    'version': 1,
+    'actions': actions,
+  }))
+
+
+class ScriptedNotifier:
+  """Makes one edit each time `watch` waits, then stops it."""
+
+  def __init__(self, edits):
+    self.edits = list(edits)
+
+  def wait(self, path, files, debounce):
+    if not self.edits:
+      raise KeyboardInterrupt()
+    self.edits.pop(0)()
+
+  def close(self):
+    pass
+
+
+class UnitTests(unittest.TestCase):
+  """Basic unit tests."""
+
+  def test_snapshot_and_sync(self):
+    """Only new and changed files are copied, and deletions are mirrored."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path, mirror = os.path.join(tmp, 'path'), os.path.join(tmp, 'mirror')
+      write(path, 'a.txt', 'a')
+      write(path, os.path.join('sub', 'b.txt'), 'b')
+      write(path, os.path.join('.git', 'HEAD'), 'ref')
+
+      files = snapshot(path)
+      self.assertEqual(
+          sorted(files), ['a.txt', os.path.join('sub', 'b.txt')])
+      changed = sync(path, mirror, {}, files)
+      self.assertEqual(changed, {
+        os.path.join(mirror, 'a.txt'),
+        os.path.join(mirror, 'sub', 'b.txt'),
+      })
+      self.assertEqual(sync(path, mirror, files, snapshot(path)), set())
+
+      write(path, 'a.txt', 'edited')
+      os.remove(os.path.join(path, 'sub', 'b.txt'))
+      latest = snapshot(path)
+      changed = sync(path, mirror, files, latest)
+      self.assertEqual(changed, {os.path.join(mirror, 'a.txt')})
+      with open(os.path.join(mirror, 'a.txt')) as f:
+        self.assertEqual(f.read(), 'edited')
+      self.assertFalse(os.path.exists(os.path.join(mirror, 'sub', 'b.txt')))
+
+  def test_get_selector(self):
+    """Only actions reading changed files run, including generated files."""
+
+    with tempfile.TemporaryDirectory() as path:
+      coffee = write(path, 'a.coffee', '')
+      write(path, 'a.js', '')
+      write(path, 'b.js', '')
+      select = get_selector(path, {coffee})
+      self.assertTrue(select({'type': 'compile-coffee', 'src': 'a.coffee'}, {}))
+      self.assertTrue(select({'type': 'minimize-js', 'src': 'a.js'}, {}))
+      self.assertFalse(select({'type': 'minimize-js', 'src': 'b.js'}, {}))
+      self.assertTrue(select({
+        'type': 'copy', 'src': './', 'dst': '[[x]]/', 'match': '.*\\.js$',
+      }, {'x': '/out'}))
+      self.assertFalse(select({'type': 'copy', 'src': 'b.js', 'dst': '/b'}, {}))
+
+  def test_get_selector_templates(self):
+    """A changed `replace-keywords` template reruns the copy using it."""
+
+    with tempfile.TemporaryDirectory() as path:
+      write(path, 'a.html', '')
+      values = write(path, 'vals.json', '[]')
+      row = {
+        'type': 'copy',
+        'src': 'a.html',
+        'dst': '/out/a.html',
+        'replace-keywords': 'vals.json',
+      }
+      self.assertTrue(get_selector(path, {values})(row, {}))
+      self.assertFalse(get_selector(path, set())(row, {}))
+      row['replace-keywords'] = ['other.json', 'vals.json']
+      self.assertTrue(get_selector(path, {values})(row, {}))
+
+  def test_get_selector_match_outputs(self):
+    """Files written by a `match` copy are inputs for later actions."""
+
+    with tempfile.TemporaryDirectory() as path:
+      changed = write(path, os.path.join('src', 'a.js'), '')
+      write(path, os.path.join('src', 'b.txt'), '')
+      select = get_selector(path, {changed})
+      self.assertTrue(select({
+        'type': 'copy', 'src': 'src/', 'dst': 'build/', 'match': '.*\\.js$',
+      }, {}))
+      self.assertTrue(select({'type': 'minimize-js', 'src': 'build/a.js'}, {}))
+      row = {'type': 'minimize-js', 'src': 'build/b.txt'}
+      self.assertFalse(select(row, {}))
+
+  def test_get_selector_restore(self):
+    """Inputs removed by an earlier `move` are restored before rerunning."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path, origin = os.path.join(tmp, 'path'), os.path.join(tmp, 'origin')
+      write(origin, os.path.join('src', 'a.py'), 'a')
+      write(origin, os.path.join('src', 'b.py'), 'b')
+      changed = write(path, os.path.join('src', 'b.py'), 'b')
+      select = get_selector(path, {changed}, origin)
+      self.assertTrue(select({
+        'type': 'move', 'src': 'src/', 'dst': '/out/', 'match': '.*\\.py$',
+      }, {}))
+      with open(os.path.join(path, 'src', 'a.py')) as f:
+        self.assertEqual(f.read(), 'a')
+
+  def run_watch(self, tmp, edits):
+    # deploy from a sibling directory, and collect any failures
+    failures = []
+
+    def execute_and_record(*args, **kwargs):
+      try:
+        execute(*args, **kwargs)
+        failures.append(None)
+      except Exception as ex:
+        failures.append(ex)
+        raise
+
+    cwd = os.getcwd()
+    os.makedirs(os.path.join(tmp, 'run'))
+    os.chdir(os.path.join(tmp, 'run'))
+    try:
+      with self.assertRaises(KeyboardInterrupt):
+        watch(
+            os.path.join(tmp, 'path'), execute_and_record,
+            notifier=ScriptedNotifier(edits))
+    finally:
+      os.chdir(cwd)
+    return failures
+
+  def test_watch_after_failure(self):
+    """Everything runs again after a failed deploy."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path, out = os.path.join(tmp, 'path'), os.path.join(tmp, 'out')
+      write_config(path, [
+        {
+          'type': 'copy',
+          'src': 'a.html',
+          'dst': '../../out/a.html',
+          'replace-keywords': 'vals.json',
+        },
+        {'type': 'copy', 'src': 'b.txt', 'dst': '../../out/b.txt'},
+      ])
+      write(path, 'a.html', 'KEY')
+      write(path, 'vals.json', '[["KEY", "v1"]]')
+      write(path, 'b.txt', 'b1')
+
+      def break_values():
+        write(path, 'b.txt', 'b22')
+        write(path, 'vals.json', 'not json')
+
+      def fix_values():
+        write(path, 'vals.json', '[["KEY", "v333"]]')
+
+      failures = self.run_watch(tmp, [break_values, fix_values])
+      self.assertEqual([ex is None for ex in failures], [True, False, True])
+      self.assertEqual(read(out, 'a.html'), 'v333')
+      self.assertEqual(read(out, 'b.txt'), 'b22')
+
+  def test_watch_config_change(self):
+    """A config change reruns everything from a fresh copy."""
+
+    with tempfile.TemporaryDirectory() as tmp:
+      path, out = os.path.join(tmp, 'path'), os.path.join(tmp, 'out')
+      actions = [{'type': 'move', 'src': 'src/a.txt', 'dst': '../../out/a.txt'}]
+      write_config(path, actions)
+      write(path, os.path.join('src', 'a.txt'), 'a')
+
+      def edit_config():
+        os.remove(os.path.join(out, 'a.txt'))
+        write_config(path, ['// a comment'] + actions)
+
+      failures = self.run_watch(tmp, [edit_config])
+      self.assertEqual(failures, [None, None])
+      self.assertEqual(read(out, 'a.txt'), 'a')
+      self.assertEqual(read(path, os.path.join('src', 'a.txt')), 'a')